@@ -1,29 +1,34 @@
 import argparse
+from functools import lru_cache
 from math import sqrt
 
-from sage.all import (GF, ZZ, EllipticCurve, Integer, Mod, PolynomialRing,
-                      hilbert_class_polynomial, kronecker, random)
+from sage.all import (GF, ZZ, EllipticCurve, Integer, hilbert_class_polynomial,
+                      isqrt, kronecker, randint)
 from sage.arith.misc import fundamental_discriminant, is_prime
 
 
+@lru_cache(maxsize=None)
+def _hcp(D):
+    return hilbert_class_polynomial(D)
+
+
+@lru_cache(maxsize=None)
+def _fundamental_discriminants():
+    return [D for D in range(-999, 0) if fundamental_discriminant(D) == D]
+
+
 def choose_random_fundamental_discriminant(r):
-    D = -Integer(Mod(int(random() * 1000), r))
-    i = 0
-    while not kronecker(D, r) == 1:  # expected number of iterations of the while loop is 2
-        D = -Integer(Mod(int(random() * 1000), r))
-        i += 1
-    D = fundamental_discriminant(D)
-    if not kronecker(D, r) == 1:
-        return 0
-    return D
+    # draw from the precomputed fundamental discriminants D > -1000,
+    # the expected number of draws until (D / r) = 1 is about 2
+    cands = _fundamental_discriminants()
+    D = cands[randint(0, len(cands) - 1)]
+    while not kronecker(D, r) == 1:
+        D = cands[randint(0, len(cands) - 1)]
+    return Integer(D)
 
 
 def find_sqrt(p, D):
-    F = GF(p)
-    D = F(D)
-    x = PolynomialRing(F, 'x').gen()
-    f = x ^ 2 - D
-    return ZZ(f.roots()[0][0])
+    return ZZ(GF(p)(D).sqrt())
 
 
 def cornacchia(p, d):
@@ -37,16 +42,18 @@ def cornacchia(p, d):
     """
     if kronecker(-d, p) == 1:
         t = find_sqrt(p, -d)
-        bound = p ^ (.5)
+        bound = isqrt(p)
         n = p
         while True:
             n, t = t, n % t
-            if t < bound:
+            if t <= bound:  # p is prime, so t <= isqrt(p) iff t < sqrt(p)
                 break
-        if ((p - t^2) / d) ^ (.5) in ZZ:
-            return (t, ZZ(((p - t^2) / d) ^ (.5)))
-        else:
-            return None
+        q, rem = divmod(p - t * t, d)
+        if rem == 0:
+            s = isqrt(q)
+            if s * s == q:
+                return (t, s)
+        return None
     else:
         return None
 
@@ -65,38 +72,41 @@ def gen_curve(p, n, r, D=None):
     DV2 = 4 * p - (t * t)
 
     # d) construct the Hilbert class polynomial P_D(X).
-    pd_x = hilbert_class_polynomial(-D)
+    pd_x = _hcp(-D)
 
     # e) find a solution j0 in F(p) of P_D(X) = 0 modulo p.
-    j0 = pd_x.any_root(GF(p))
+    Fp = GF(p)
+    j0 = pd_x.any_root(Fp)
+    # a single inversion of 1728 - j0 per curve, reused for every c
+    j0_over = None if j0 in (0, 1728) else j0 * ~(1728 - j0)
 
     while True:
         # f) choose c ∈ F(p)* and construct an elliptic curve over F(p) with the j-invariant j0.
-        c = GF(p).random_element()
+        c = Fp.random_element()
         if c == 0:
             continue
 
         if j0 == 0:  # 2) j0 = 0_F
-            E = EllipticCurve(GF(p), [0, c])
+            E = EllipticCurve(Fp, [0, c])
         elif j0 == 1728:  # 3) j0 = 1728
-            E = EllipticCurve(GF(p), [c, 0])
+            E = EllipticCurve(Fp, [c, 0])
         else:  # 1) j0 ≠ 0_F, 1 728
-            a4 = (3 * c**2 * j0) / (1728 - j0)
-            a6 = (2 * c**3 * j0) / (1728 - j0)
-            E = EllipticCurve(GF(p), [a4, a6])
+            c2 = c * c
+            a4 = 3 * c2 * j0_over
+            a6 = 2 * c2 * c * j0_over
+            E = EllipticCurve(Fp, [a4, a6])
 
         # g) construct a random point G on E_{D,j0,c}[F(p)] such that G ≠ O_E and r·G ≠ O_E
-        G = E.random_point()
-        while G == 0 or r * G == 0:
-            G = E.random_point()
-
         # h) set G = r·G
-        G = r * G
+        #    r·P ≠ O_E already implies P ≠ O_E, so a single check suffices
+        G = r * E.random_point()
+        while G == 0:
+            G = r * E.random_point()
 
         # i) If n·G = O_E, output curve parameters of E_{D,j0,c} and the base point G.
         #    If n·G ≠ O_E, go to step f) to choose another c.
-        n = G.order()
-        if is_prime(n):
+        #    G ≠ O_E and n is prime, so n·G = O_E means G has order exactly n
+        if n * G == 0:
             return E, G
 
 
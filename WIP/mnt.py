@@ -1,14 +1,66 @@
 import argparse
-from math import ceil, log2
+from math import ceil
+from multiprocessing import Pool
 
-from sage.all import ZZ, IntegerModRing, floor, is_prime, is_square, sqrt
-from sage.arith.misc import is_squarefree
+import gmpy2
+from sage.all import ZZ, floor, is_prime, is_square, isqrt, primes, sqrt
 
 """
 Implementation follows the appendix of the paper 
 'On prime-order elliptic curves with embedding degrees k = 3, 4 and 6' by Koray Karabina and Edlyn Teske
 """
 
+SMALL_PRIMES = [int(p) for p in primes(10000)]
+
+def _fast_composite(m):
+    """
+    Trial division by SMALL_PRIMES, run before the full primality test.
+    Returns True if m is certainly composite.
+    """
+    for p in SMALL_PRIMES:
+        if m % p == 0:
+            return m != p
+    return False
+
+# quadratic residues modulo small moduli, together they reject > 99% of non-squares
+SQ64 = {x * x % 64 for x in range(64)}
+SQ63 = {x * x % 63 for x in range(63)}
+SQ65 = {x * x % 65 for x in range(65)}
+SQ11 = {x * x % 11 for x in range(11)}
+
+def _maybe_square(n):
+    """
+    Cheap necessary condition for n being a perfect square
+    """
+    return n >= 0 and (n & 63) in SQ64 and n % 63 in SQ63 and n % 65 in SQ65 and n % 11 in SQ11
+
+def _is_prime_small(n):
+    """
+    Deterministic Miller-Rabin with the prime bases up to 37, correct for n < 2^64
+    """
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13):
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d & 1 == 0:
+        d >>= 1
+        s += 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if a >= n:
+            continue
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
 def pell_solve_1(D, m):
     """
     Algorithm 1 Pell Equation Solver
@@ -19,30 +71,35 @@ def pell_solve_1(D, m):
     assert D > m*m
     assert not is_square(D)
 
-    B = [0, 1]
-    P = [None, 0]
-    Q = [None, 1]
-    a = [None, floor(sqrt(D))]
-    G = [1, a[1]]
+    D, m = int(D), int(m)
+    sqrt_D = int(isqrt(D))
 
+    # only the last two terms of each recurrence are needed,
+    # and every (G_j, B_j) for 1 ≤ j < i is checked as soon as it is computed
+    B_prev, B_curr = 0, 1
+    G_prev, G_curr = 1, sqrt_D
+    P, Q, a = 0, 1, sqrt_D
+
+    sols = []
     i = 1
     while True:
+        # f has to be an integer (Algorithm 1), so rational squares such as 1/4 are rejected
+        f2, rem = divmod(G_curr * G_curr - D * B_curr * B_curr, m)
+        if rem == 0 and _maybe_square(f2):
+            f = int(isqrt(f2))
+            if f * f == f2:
+                sols.append((ZZ(f * G_curr), ZZ(f * B_curr)))
+
         i += 1
-        P.append(a[i - 1] * Q[i - 1] - P[i - 1])
-        Q.append((D - P[i]**2) / Q[i - 1])
-        a.append(floor((P[i] + sqrt(D)) / Q[i]))
-        B.append(a[i] * B[i - 1] + B[i - 2])
-        G.append(a[i] * G[i - 1] + G[i - 2])
+        P = a * Q - P
+        Q = (D - P * P) // Q
+        a = (P + sqrt_D) // Q
+        B_prev, B_curr = B_curr, a * B_curr + B_prev
+        G_prev, G_curr = G_curr, a * G_curr + G_prev
 
-        if Q[i] == 1 and i % 2 == 1:
+        if Q == 1 and i % 2 == 1:
             break
 
-    sols = []
-    for j in range(1, i):
-        f2 = (G[j]**2 - D * B[j]**2) / m
-        if is_square(f2):
-            f = sqrt(f2)
-            sols.append((f * G[j], f * B[j]))
     return sols
 
 def pell_solve_2(D, m):
@@ -76,70 +133,147 @@ def pell_solve_2(D, m):
                 sols.append((x, y))
     return sols
 
-def gen_curve(N, z):
+def _squarefree_sieve(N):
+    """
+    sf[m] is True iff m is square-free, for 0 ≤ m ≤ N
+    """
+    sf = [True] * (N + 1)
+    for p in primes(isqrt(N) + 1):
+        p2 = p * p
+        for k in range(p2, N + 1, p2):
+            sf[k] = False
+    return sf
+
+def _minus_two_square_sieve(N):
+    """
+    qr[m] is True iff -2 is a square modulo m, for odd 0 < m ≤ N.
+    By Hensel's lemma and CRT this holds iff every prime divisor p of m
+    satisfies (-2 / p) = 1, i.e. p ≡ 1, 3 (mod 8).
+    """
+    qr = [True] * (N + 1)
+    for p in primes(3, N + 1):
+        if p % 8 in (5, 7):
+            for k in range(p, N + 1, p):
+                qr[k] = False
+    return qr
+
+def _search_discriminant(N, D):
+    """
+    Body of Algorithm 3 for a single candidate D that already passed the sieves in gen_curve.
+    Returns (q, n, D // 3) on success, otherwise None.
+    """
+    if D > 64:
+        sols = pell_solve_1(D, -8)
+        if not sols:
+            return None
+        x0, y0 = sols[0]
+    else:
+        sols = pell_solve_2(D, -8)
+        if not sols:
+            return None
+        x0, y0 = sols[0]
+
+    # plain Python ints have much lower per-operation overhead than Sage Integers
+    u, v = pell_solve_1(D, 1)[0]
+    u, v, x0, y0 = int(u), int(v), int(x0), int(y0)
+    x, y = x0, y0
+
+    # |x| ≤ 2^⌈N/2⌉ and (N - 3)/2 ≤ log2(l) < (N - 2)/2, i.e. 2^(N-3) ≤ l^2 < 2^(N-2)
+    BOUND = 1 << ((N + 1) // 2)
+    L2_LO, L2_HI = 1 << (N - 3), 1 << (N - 2)
+    # q and n have about N bits
+    if N <= 64:
+        # _is_prime_small is deterministic below 2^64, nothing is left to prove
+        def is_prime_pair(q, n):
+            return _is_prime_small(q) and _is_prime_small(n)
+    else:
+        # gmpy2.is_prime is only a probable-prime filter (see utils.is_probable_prime),
+        # so an accepted pair is proven prime with is_prime
+        def is_prime_pair(q, n):
+            return gmpy2.is_prime(q) and gmpy2.is_prime(n) and is_prime(q) and is_prime(n)
+
+    remainder = x % 6
+    if remainder == 5:
+        remainder = -1
+    if remainder == 1 or remainder == -1:
+        while -BOUND <= x <= BOUND:
+            l, rem = divmod(x - remainder, 6)
+            if rem == 0 and l > 0 and L2_LO <= l * l < L2_HI:
+                q = 4 * l * l + 1
+                n = q - remainder * 2 * l
+                if not _fast_composite(q) and not _fast_composite(n) and is_prime_pair(q, n):
+                    return (ZZ(q), ZZ(n), D // 3)
+
+            old_x = x
+            x = x * u + y * v * D
+            y = old_x * v + u * y
+
+    x, y = x0 * u - y0 * v * D, u * y0 - x0 * v
+    remainder = x % 6
+    if remainder == 5:
+        remainder = -1
+    if remainder == 1 or remainder == -1:
+        while -BOUND <= x <= BOUND:
+            l, rem = divmod(x - remainder, 6)
+            if l < 0:
+                break
+            if rem == 0 and l > 0 and L2_LO <= l * l < L2_HI:
+                q = 4 * l * l + 1
+                n = q - remainder * 2 * l
+                if not _fast_composite(q) and not _fast_composite(n) and is_prime_pair(q, n):
+                    return (ZZ(q), ZZ(n), D // 3)
+
+            old_x = x
+            x = x * u - y * v * D
+            y = u * y - old_x * v
+
+    return None
+
+def _search_indexed(args):
+    i, N, D = args
+    return i, _search_discriminant(N, D)
+
+def gen_curve(N, z, workers=1):
     """
     Algorithm 3 Elliptic curve parameters, embedding degree k = 6
     Input: N, z
     Output: EC parameters (q, n, D) where q - 1 is an N-bit prime, q^6 ≡ 1 (mod n)
     but q^i !≡ 1 (mod n) for 1 ≤ i ≤ 5, and D ≤ z (where 4q - t^2 = DY^2)
+
+    With workers > 1 the candidate discriminants are searched by that many processes,
+    otherwise the sweep runs sequentially in this process. Both return the same curve.
     """
 
-    for D in range(9, 3 * z + 1, 24):
-        if not is_squarefree(ZZ(D) / 3) or is_square(D):
-            continue
-        if not is_square(IntegerModRing(D)(-2)):
-            continue
+    # D / 3 has to be square-free and -2 has to be a square modulo D
+    sf = _squarefree_sieve(z)
+    qr = _minus_two_square_sieve(3 * z)
+    Ds = [D for D in range(9, 3 * z + 1, 24) if sf[D // 3] and qr[D] and not is_square(D)]
+    if workers is None or workers <= 1:
+        for D in Ds:
+            curve = _search_discriminant(N, D)
+            if curve is not None:
+                return curve
+        return None
 
-        if D > 64:
-            sols = pell_solve_1(D, -8)
-            if not sols:
-                continue
-            x0, y0 = sols[0]
-        else:
-            sols = pell_solve_2(D, -8)
-            if not sols:
-                continue
-            x0, y0 = sols[0]
-
-        u, v = pell_solve_1(D, 1)[0]
-        x, y = x0, y0
-
-        remainder = int(x) % 6
-        if remainder == 5:
-            remainder = -1
-        if remainder == 1 or remainder == -1:
-            while abs(x) <= 2**ceil(N / 2):
-                l = (x - remainder) / 6
-                if (((N - 3) / 2) <= log2(l) < ((N - 2) / 2)):
-                    q = 4 * l**2 + 1
-                    n = 4 * l**2 - remainder * 2 * l + 1
-                    if is_prime(q) and is_prime(n):
-                        return (q, n, D / 3)
-                
-                old_x = x
-                x = x * u + y * v * D
-                y = old_x * v + u * y
-
-        x, y = x0 * u - y0 * v * D, u * y0 - x0 * v
-        remainder = int(x) % 6
-        if remainder == 5:
-            remainder = -1
-        if remainder == 1 or remainder == -1:
-            while abs(x) <= 2**ceil(N / 2):
-                l = (x - remainder) / 6
-                if l < 0:
-                    break
-                if (((N - 3) / 2) <= log2(l) < ((N - 2) / 2)):
-                    q = 4 * l**2 + 1
-                    n = 4 * l**2 - remainder * 2 * l + 1
-                    if is_prime(q) and is_prime(n):
-                        return (q, n, D / 3)
-                
-                old_x = x
-                x = x * u - y * v * D
-                y = u * y - old_x * v
+    # The D candidates are independent, so each one is a separate task and a worker picks
+    # up the next D as soon as it is free. Results arrive in completion order; the hit with
+    # the smallest D is returned once every smaller D has been resolved, like in the
+    # sequential sweep. Leaving the with block terminates the workers still running.
+    done = [False] * len(Ds)
+    first_open = 0
+    best = None
+    with Pool(processes=workers) as pool:
+        tasks = ((i, N, D) for i, D in enumerate(Ds))
+        for i, curve in pool.imap_unordered(_search_indexed, tasks):
+            done[i] = True
+            if curve is not None and (best is None or i < best[0]):
+                best = (i, curve)
+            while first_open < len(Ds) and done[first_open]:
+                first_open += 1
+            if best is not None and first_open > best[0]:
+                break
 
-    return None
+    return None if best is None else best[1]
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -148,7 +282,9 @@ if __name__ == '__main__':
                         help='the q bitlength')
     parser.add_argument('--z', metavar='p', type=int,
                         help='the maximum value of the CM discriminant')
+    parser.add_argument('--workers', metavar='w', type=int,
+                        help='number of worker processes', default=1)
 
     args = parser.parse_args()
-    q, n, D = gen_curve(args.N, args.z)
+    q, n, D = gen_curve(args.N, args.z, args.workers)
     print(q, n, D)
@@ -4,7 +4,49 @@ import itertools
 from sage.all import GF, EllipticCurve, kronecker, sqrt
 from sage.arith.misc import is_prime
 
-from utils import is_embedding_degree
+from utils import is_embedding_degree, is_probable_prime
+
+
+# For x = ±u, p = 36x^4 + 36x^3 + 24x^2 + 6x + 1 and n = p + 1 - t = 36x^4 + 36x^3 + 18x^2 + 6x + 1.
+# Both are always odd and ≡ 1 (mod 3), so the wheel starts at 5.
+WHEEL_PRIMES = (5, 7, 11, 13, 17, 19, 23, 29, 31)
+BAD_RESIDUES = {
+    q: frozenset(x for x in range(q)
+                 if (36 * x**4 + 36 * x**3 + 24 * x**2 + 6 * x + 1) % q == 0
+                 or (36 * x**4 + 36 * x**3 + 18 * x**2 + 6 * x + 1) % q == 0)
+    for q in WHEEL_PRIMES
+}
+# primes that never divide p or n (e.g. q ≡ 5 mod 6) are useless for the wheel
+BAD_RESIDUES = {q: bad for q, bad in BAD_RESIDUES.items() if bad}
+
+
+def _passes_wheel(x):
+    """
+    False if p or n for x = ±u is divisible by one of WHEEL_PRIMES
+    (and hence composite, as p and n are much larger than the wheel primes)
+    """
+    return all(x % q not in bad for q, bad in BAD_RESIDUES.items())
+
+
+def _forward_differences(f, u, degree):
+    """
+    [f(u), Δf(u), ..., Δ^degree f(u)] for a polynomial f of the given degree,
+    so that f can be evaluated at u + 1, u + 2, ... using additions only
+    """
+    values = [f(u + i) for i in range(degree + 1)]
+    diffs = []
+    for _ in range(degree + 1):
+        diffs.append(values[0])
+        values = [b - a for a, b in zip(values, values[1:])]
+    return diffs
+
+
+def _advance(diffs):
+    """
+    Move forward differences computed at u to u + 1 in place
+    """
+    for i in range(len(diffs) - 1):
+        diffs[i] += diffs[i + 1]
 
 
 def gen_curve(m, p_max):
@@ -17,6 +59,10 @@ def gen_curve(m, p_max):
     p = P(-u)
     found_curve = False
 
+    # P(−u) and P(u) are evaluated at consecutive u, so track their forward differences
+    P_minus = _forward_differences(lambda u: P(-u), u, 4)
+    P_plus = _forward_differences(P, u, 4)
+
     # c) While p ≤ p_max
     while True:
         while p.bit_length() <= p_max:
@@ -24,25 +70,29 @@ def gen_curve(m, p_max):
             t = 6 * (u*u) + 1
 
             # 2) p = P(−u) and n = p + 1 − t.
-            p = P(-u)
+            p = P_minus[0]
             n = p + 1 - t
 
             # 3) If p and n are prime, then go to step e).
-            if is_prime(p) and is_prime(n):
+            if (_passes_wheel(-u) and is_probable_prime(p) and is_probable_prime(n)
+                    and is_prime(p) and is_prime(n)):
                 found_curve = True
                 break
 
             # 4) p = P(u) and n = p + 1 − t.
-            p = P(u)
+            p = P_plus[0]
             n = p + 1 - t
 
             # 5) If p and n are prime, then go to step e).
-            if is_prime(p) and is_prime(n):
+            if (_passes_wheel(u) and is_probable_prime(p) and is_probable_prime(n)
+                    and is_prime(p) and is_prime(n)):
                 found_curve = True
                 break
 
             # 6) u = u + 1 and go to step 1).
             u += 1
+            _advance(P_minus)
+            _advance(P_plus)
 
         # d) Stop and output "fail".
         if not found_curve:
@@ -62,14 +112,20 @@ def gen_curve(m, p_max):
             y0 = gf(b + 1).sqrt()
 
             # j) Set the basepoint G = (1, y_0) ∈ E.
-            G = E(1, y0)
+            #    y_0^2 = 1 + b holds by construction, so skip the on-curve check.
+            G = E.point([1, y0, 1], check=False)
 
             # k) If n⋅G ≠ O_E, then set b = b + 1 and go to step g).
             if n * G == 0:
+                # G ≠ O_E has prime order n ≈ p, so by the Hasse bound #E = n;
+                # record it so that E.order() does not count points from scratch
+                E.set_order(n)
                 break
 
         assert is_embedding_degree(E, 12), "Embedding degree is not 12!"
         u += 1
+        _advance(P_minus)
+        _advance(P_plus)
         # l) Output p, E, n, and G.
         yield p, E, n, G
 
@@ -1,42 +1,53 @@
 import argparse
+from functools import lru_cache
 
-from sage.all import (GF, EllipticCurve, Integer, Mod,
-                      fundamental_discriminant, hilbert_class_polynomial,
-                      kronecker, power_mod, randint, random, random_prime,
-                      sqrt)
-from sage.arith.misc import is_prime
+import gmpy2
+from sage.all import (GF, EllipticCurve, Integer, fundamental_discriminant,
+                      hilbert_class_polynomial, kronecker, randint,
+                      random_prime, sqrt)
+from sage.arith.misc import is_prime, prime_divisors
 
 from utils import is_embedding_degree
 
 
+@lru_cache(maxsize=None)
+def _hcp(D):
+    return hilbert_class_polynomial(D)
+
 def find_prime(num_bits, B):
     p = 0
     while not p % B == 1:
         p = random_prime(2 ** num_bits, lbound=2 ** (num_bits - 1))
     return p
 
+@lru_cache(maxsize=None)
+def _fundamental_discriminants():
+    return [D for D in range(-999, 0) if fundamental_discriminant(D) == D]
+
 def find_fundamental_discriminant(n):
-    D = 0
+    # draw from the precomputed fundamental discriminants D > -1000,
+    # the expected number of draws until (D / n) = 1 is about 2
+    cands = _fundamental_discriminants()
+    D = cands[randint(0, len(cands) - 1)]
     while not kronecker(D, n) == 1:
-        D = -Integer(Mod(int(random() * 1000), n))
-    D = fundamental_discriminant(D)
-    assert kronecker(D, n) == 1
-    return D
+        D = cands[randint(0, len(cands) - 1)]
+    return Integer(D)
 
 def find_element_of_order(B, n):
     assert n % B == 1
-    h = 0
-    def order(h, k, p):
-        bool = True
-        g = h
-        for _ in range(1, k):
-            bool = bool and g != 1
-            g = Mod(g * h, p)
-        bool = bool and g == 1
-        return bool
-    while not order(h, B, n):
-        h = power_mod(randint(2, n - 1), (n - 1) // B, n)
-    return h
+    # h^B = 1 by construction, so h has order B iff h^(B/q) != 1 for every prime q | B.
+    # Larger q give smaller exponents B/q, so they are cheaper and tested first.
+    factors = sorted(prime_divisors(B), reverse=True)
+    # gmpy2.powmod calls GMP's mpz_powm directly, which is faster than Sage's power_mod
+    _n = gmpy2.mpz(int(n))
+    _e = (_n - 1) // int(B)
+    exponents = [gmpy2.mpz(int(B // q)) for q in factors]
+    while True:
+        h = gmpy2.powmod(gmpy2.mpz(int(randint(2, n - 1))), _e, _n)
+        if h == 1:
+            continue
+        if all(gmpy2.powmod(h, e, _n) != 1 for e in exponents):
+            return Integer(h)
 
 def gen_curve(B, num_bits):
     p = 0
@@ -65,40 +76,43 @@ def gen_curve(B, num_bits):
         p = ((t ** 2) + D * (y ** 2)) / 4
 
     # i) Construct the Hilbert class polynomial P_D(X).
-    pd_x = hilbert_class_polynomial(D)
+    pd_x = _hcp(D)
 
     # j) Find a solution j_0 in F(p) of P_D(X) = 0 modulo p.
-    j0 = pd_x.any_root(GF(p))
+    Fp = GF(p)
+    j0 = pd_x.any_root(Fp)
+    # a single inversion of 1728 - j0 per curve, reused for every c
+    j0_over = None if j0 in (0, 1728) else j0 * ~(1728 - j0)
 
     while True:
         # k) Choose c ∈ F(p)* and construct an elliptic curve over F(p) with the j-invariant j_0.
-        c = GF(p).random_element()
+        c = Fp.random_element()
         if c == 0:
             continue
 
         if j0 == 0:  # 2) j0 = 0_F
-            E = EllipticCurve(GF(p), [0, c])
+            E = EllipticCurve(Fp, [0, c])
         elif j0 == 1728:  # 3) j0 = 1728
-            E = EllipticCurve(GF(p), [c, 0])
+            E = EllipticCurve(Fp, [c, 0])
         else:  # 1) j0 ≠ 0_F, 1 728
-            a4 = (3 * c**2 * j0) / (1728 - j0)
-            a6 = (2 * c**3 * j0) / (1728 - j0)
-            E = EllipticCurve(GF(p), [a4, a6])
+            c2 = c * c
+            a4 = 3 * c2 * j0_over
+            a6 = 2 * c2 * c * j0_over
+            E = EllipticCurve(Fp, [a4, a6])
         
         # l) Set a cofactor r = (p + 1 - t) / n.
         r = (p + 1 - t) / n
 
         # m) construct a random point G on E_{D,j_0,c}[F(p)] such that G ≠ O_E and r·G ≠ O_E
-        G = E.random_point()
-        while G == 0 or r * G == 0:
-            G = E.random_point()
-
         # n) set G = r·G
-        G = r * G
+        #    r·P ≠ O_E already implies P ≠ O_E, so a single check suffices
+        G = r * E.random_point()
+        while G == 0:
+            G = r * E.random_point()
 
         # o) If n·G = O_E, output n, G, and the elliptic curve E.
-        n = G.order()
-        if is_prime(n):
+        #    G ≠ O_E and n is prime, so n·G = O_E means G has order exactly n
+        if n * G == 0:
             break
 
         # p) Else, go to step k) to choose another c ∈ F(p)*.
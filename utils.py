@@ -1,4 +1,19 @@
-from sage.all import EllipticCurve
+import gmpy2
+from sage.all import EllipticCurve, power_mod
+from sage.arith.misc import prime_divisors
 
 def is_embedding_degree(E: EllipticCurve, k):
-    return (E.base_field().order() ** k - 1) % E.order() == 0
+    # the multiplicative order of q modulo n has to be exactly k
+    q = E.base_field().order()
+    n = E.order()
+    if power_mod(q, k, n) != 1:
+        return False
+    for p in prime_divisors(k):
+        if power_mod(q, k // p, n) == 1:
+            return False
+    return True
+
+def is_probable_prime(x):
+    # GMP's mpz_probab_prime_p has much lower per-call overhead than Sage's is_prime,
+    # but it is only a probable-prime test: confirm accepted values with is_prime
+    return gmpy2.is_prime(gmpy2.mpz(int(x)))